@@ -287,6 +287,11 @@ const PlateDetection = () => {
                                     <Typography variant="body2" color="textSecondary">
                                       Position: ({detection.bbox.x1}, {detection.bbox.y1}) - ({detection.bbox.x2}, {detection.bbox.y2})
                                     </Typography>
+                                    {detection.matches?.length > 0 && (
+                                      <Typography variant="body2" color="primary">
+                                        In queue: {detection.matches.map((m) => `${m.tokenNumber} (${m.vehicleNumber})`).join(', ')}
+                                      </Typography>
+                                    )}
                                   </Box>
                                 }
                               />
@@ -105,12 +105,48 @@ export const ProcessProvider = ({ children }) => {
     const [error, setError] = useState(null);
     // Store detected vehicle number from plate recognition
     const [detectedVehicleNumber, setDetectedVehicleNumber] = useState('');
+    // Backend revision the local queue is in sync with (null until loaded)
+    const [revision, setRevision] = useState(null);
 
     // Load data from backend on mount
     useEffect(() => {
         loadProcessesFromBackend();
     }, []);
 
+    // Apply one change from the backend change feed to the local queue
+    const applyChange = (change) => {
+        if (change.op === 'reset') {
+            loadProcessesFromBackend();
+            return;
+        }
+        setProcessQueue((prevQueue) => {
+            if (change.op === 'delete') {
+                return prevQueue.filter((p) => p.tokenNumber !== change.tokenNumber);
+            }
+            const existing = prevQueue.findIndex((p) => p.id === change.data.id);
+            if (existing === -1) {
+                return [change.data, ...prevQueue];
+            }
+            const updated = [...prevQueue];
+            updated[existing] = change.data;
+            return updated;
+        });
+    };
+
+    // Subscribe to live queue updates once the initial load has a revision
+    useEffect(() => {
+        if (revision === null || typeof EventSource === 'undefined') return undefined;
+
+        const source = new EventSource(`${API_BASE}/processes/stream?since=${revision}`);
+        ['insert', 'update', 'delete', 'reset'].forEach((op) => {
+            source.addEventListener(op, (event) => {
+                const change = JSON.parse(event.data);
+                applyChange(op === 'reset' ? { ...change, op } : change);
+            });
+        });
+        return () => source.close();
+    }, [revision]);
+
     // Function to load processes from backend
     const loadProcessesFromBackend = async () => {
         try {
@@ -119,6 +155,7 @@ export const ProcessProvider = ({ children }) => {
             if (response.ok) {
                 const result = await response.json();
                 setProcessQueue(result.data || []);
+                setRevision(result.revision ?? null);
                 setError(null);
             } else {
                 console.warn('Failed to load processes from backend, using local cache');
@@ -144,9 +181,8 @@ export const ProcessProvider = ({ children }) => {
     const addWaitInEntry = async (formData) => {
         try {
             const now = new Date();
-            const newEntry = {
+            let newEntry = {
                 waitIn: formData,
-                tokenNumber: generateDailyToken(formData.category),
                 date: now.toLocaleDateString('en-US', { year: 'numeric', month: '2-digit', day: '2-digit' }),
                 vehicleNumber: formData.vehicleNumber,
                 arrivalTime: now.toLocaleTimeString('en-US', { hour: '2-digit', minute: '2-digit', hour12: false }),
@@ -154,7 +190,7 @@ export const ProcessProvider = ({ children }) => {
                 waitOut: null,
             };
 
-            // Try to save to backend
+            // Try to save to backend (the backend assigns the daily token)
             try {
                 const response = await fetch(`${API_BASE}/processes`, {
                     method: 'POST',
@@ -163,12 +199,19 @@ export const ProcessProvider = ({ children }) => {
                 });
 
                 if (!response.ok) throw new Error('Backend save failed');
+                const result = await response.json();
+                newEntry = result.data;
             } catch (err) {
                 console.warn('Could not save to backend, saving locally:', err);
+                // Offline fallback: generate the token locally
+                newEntry = { ...newEntry, tokenNumber: generateDailyToken(formData.category) };
             }
 
-            // Update local state
-            setProcessQueue((prevQueue) => [newEntry, ...prevQueue]);
+            // Update local state (the change feed may already have delivered this entry)
+            setProcessQueue((prevQueue) => [
+                newEntry,
+                ...prevQueue.filter((p) => !newEntry.id || p.id !== newEntry.id),
+            ]);
             
             // Cache to local storage as fallback
             const updated = [newEntry, ...processQueue];
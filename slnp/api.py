@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import cv2
 import numpy as np
@@ -7,14 +7,21 @@ import pytesseract
 import easyocr
 import re
 import os
+import json
 import base64
+from datetime import date, datetime
 from io import BytesIO
 from PIL import Image
 from database import Database
-from excel_handler import ExcelHandler
+from excel_handler import ExcelHandler, EXPORT_FORMATS
+from reports import Reports
+from plate_quality import assess_plate, correct_skew
 
 os.environ["YOLO_VERBOSE"] = "False"
 
+# Seconds between keep-alive comments on idle change streams
+STREAM_KEEPALIVE = 15
+
 app = Flask(__name__)
 CORS(app)
 
@@ -22,6 +29,7 @@ CORS(app)
 MODEL_PATH = "best.pt"
 OUTPUT_PLATE = "./Output/plate.png"
 OUTPUT_CLEAN = "./Output/plate_clean.png"
+DESKEW_PLATES = True  # Rotate skewed plate crops level before OCR
 
 # Create output directory if not exists
 os.makedirs("./Output", exist_ok=True)
@@ -85,8 +93,11 @@ def read_plate_text(clean):
     return final
 
 
-def detect_plates_in_image(frame):
-    """Detect number plates in image"""
+def detect_plates_in_image(frame, scale=(1.0, 1.0)):
+    """
+    Detect number plates in image
+    'scale' maps the resized frame back to the uploaded one (see assess_plate)
+    """
     results = model.predict(frame, conf=0.4)
     detections = []
     
@@ -99,6 +110,13 @@ def detect_plates_in_image(frame):
             if plate.size == 0:
                 continue
             
+            # Skip blurred, tiny or badly skewed crops that OCR can't read
+            quality = assess_plate(plate, scale)
+            if not quality["ok"]:
+                continue
+            if DESKEW_PLATES:
+                plate = correct_skew(plate, quality["skew"])
+            
             cv2.imwrite(OUTPUT_PLATE, plate)
             
             clean = preprocess_for_ocr(plate)
@@ -109,12 +127,41 @@ def detect_plates_in_image(frame):
                 "bbox": {"x1": int(x1), "y1": int(y1), "x2": int(x2), "y2": int(y2)},
                 "raw_text": raw_text,
                 "formatted_text": formatted,
-                "confidence": confidence
+                "confidence": confidence,
+                "quality": quality
             })
     
     return detections
 
 
+def attach_queue_matches(detections):
+    """Add the open processes matching each detected plate to the detections"""
+    for det in detections:
+        det["matches"] = Database.find_open_by_vehicle(det["formatted_text"])
+    return detections
+
+
+def _date_range():
+    """
+    Optional 'from'/'to' query parameters as ISO dates (YYYY-MM-DD)
+    Raises ValueError for a malformed date or a reversed range
+    """
+    start_date, end_date = (_parse_date(request.args.get(name)) for name in ('from', 'to'))
+    if start_date and end_date and start_date > end_date:
+        raise ValueError("'from' must not be after 'to'")
+    return start_date, end_date
+
+
+def _parse_date(value):
+    """Normalize a YYYY-MM-DD date string, or None when missing"""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
 def image_to_base64(image_array):
     """Convert OpenCV image to base64 string"""
     _, buffer = cv2.imencode('.jpg', image_array)
@@ -151,9 +198,10 @@ def detect():
         
         # Resize for processing
         frame_small = cv2.resize(frame, (320, 256))
+        scale = (frame.shape[1] / 320, frame.shape[0] / 256)
         
-        # Detect plates
-        detections = detect_plates_in_image(frame_small)
+        # Detect plates and look up their open processes
+        detections = attach_queue_matches(detect_plates_in_image(frame_small, scale))
         
         # Prepare response image with detections drawn
         response_frame = frame_small.copy()
@@ -196,9 +244,10 @@ def detect_base64():
         
         # Resize for processing
         frame_small = cv2.resize(frame, (320, 256))
+        scale = (frame.shape[1] / 320, frame.shape[0] / 256)
         
-        # Detect plates
-        detections = detect_plates_in_image(frame_small)
+        # Detect plates and look up their open processes
+        detections = attach_queue_matches(detect_plates_in_image(frame_small, scale))
         
         # Prepare response image
         response_frame = frame_small.copy()
@@ -224,27 +273,93 @@ def detect_base64():
 
 @app.route('/api/processes', methods=['GET'])
 def get_processes():
-    """Get all stored process entries"""
+    """
+    Get stored process entries
+    Defaults to today's working set; optional 'from'/'to' (YYYY-MM-DD) query
+    parameters read the matching archive partitions instead
+    """
     try:
-        processes = Database.get_all_processes()
+        start_date, end_date = _date_range()
+        # Read the revision first so changes made while loading are replayed, not lost
+        revision = Database.get_revision()
+        processes = Database.get_processes(start_date, end_date)
         return jsonify({
             "success": True,
             "data": processes,
-            "count": len(processes)
+            "count": len(processes),
+            "revision": revision
         })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/api/processes/changes', methods=['GET'])
+def get_process_changes():
+    """
+    Get the process changes made after a revision
+    Expects a 'since' query parameter (revision from a previous response);
+    'reset' is true when the client has to reload GET /api/processes
+    """
+    try:
+        since = request.args.get('since', default=0, type=int)
+        revision, changes, complete = Database.get_changes(since)
+        return jsonify({
+            "success": True,
+            "revision": revision,
+            "changes": changes,
+            "reset": not complete
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/processes/stream', methods=['GET'])
+def stream_process_changes():
+    """
+    Server-Sent Events stream of process changes
+    Starts after the 'since' query parameter (or the Last-Event-ID header)
+    and emits one 'insert', 'update', 'delete' or 'reset' event per change
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', default=Database.get_revision(), type=int)
+    
+    def events(since):
+        while True:
+            revision, changes, complete = Database.wait_for_changes(since, timeout=STREAM_KEEPALIVE)
+            if not complete:
+                yield f"id: {revision}\nevent: reset\ndata: {{}}\n\n"
+            elif not changes:
+                yield ": keep-alive\n\n"
+            for change in changes:
+                yield f"id: {change['revision']}\nevent: {change['op']}\ndata: {json.dumps(change)}\n\n"
+            since = revision
+    
+    return Response(
+        stream_with_context(events(since)),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.route('/api/processes', methods=['POST'])
 def create_process():
-    """Create a new process entry"""
+    """
+    Create a new process entry
+    When no 'tokenNumber' is sent, the next daily token for the process
+    category is assigned by the server in the same request
+    """
     try:
         data = request.get_json()
         if not data:
             return jsonify({"success": False, "error": "No data provided"}), 400
         
-        process = Database.add_process(data)
+        if data.get("tokenNumber"):
+            process = Database.add_process(data)
+        else:
+            process = Database.create_process_with_token(data)
         return jsonify({
             "success": True,
             "message": "Process created successfully",
@@ -256,9 +371,13 @@ def create_process():
 
 @app.route('/api/processes/<token_number>', methods=['GET'])
 def get_process(token_number):
-    """Get a specific process by token number"""
+    """
+    Get a specific process by token number
+    Tokens restart every day: an optional 'date' (YYYY-MM-DD) picks the day
+    it was finished on, otherwise the most recent process with the token
+    """
     try:
-        process = Database.get_process_by_token(token_number)
+        process = Database.get_process_by_token(token_number, _parse_date(request.args.get('date')))
         if process:
             return jsonify({
                 "success": True,
@@ -269,19 +388,21 @@ def get_process(token_number):
                 "success": False,
                 "error": "Process not found"
             }), 404
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
 @app.route('/api/processes/<token_number>', methods=['PUT'])
 def update_process(token_number):
-    """Update an existing process"""
+    """Update an existing process (optional 'date' as for GET)"""
     try:
         data = request.get_json()
         if not data:
             return jsonify({"success": False, "error": "No data provided"}), 400
         
-        process = Database.update_process(token_number, data)
+        process = Database.update_process(token_number, data, _parse_date(request.args.get('date')))
         if process:
             return jsonify({
                 "success": True,
@@ -293,18 +414,122 @@ def update_process(token_number):
                 "success": False,
                 "error": "Process not found"
             }), 404
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
 @app.route('/api/processes/<token_number>', methods=['DELETE'])
 def delete_process(token_number):
-    """Delete a process entry"""
+    """Delete a process entry (optional 'date' as for GET)"""
+    try:
+        if Database.delete_process(token_number, _parse_date(request.args.get('date'))):
+            return jsonify({
+                "success": True,
+                "message": "Process deleted successfully"
+            })
+        else:
+            return jsonify({
+                "success": False,
+                "error": "Process not found"
+            }), 404
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# ==================== REPORT ENDPOINTS ====================
+
+@app.route('/api/reports/daily', methods=['GET'])
+def daily_report():
+    """
+    Per-day totals from the incremental rollups
+    Optional 'from'/'to' (YYYY-MM-DD) query parameters limit the range
+    """
+    try:
+        report = Reports.daily(*_date_range())
+        return jsonify({
+            "success": True,
+            "data": report,
+            "count": len(report)
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/reports/summary', methods=['GET'])
+def summary_report():
+    """Combined totals over an optional 'from'/'to' date range"""
+    try:
+        return jsonify({
+            "success": True,
+            "data": Reports.summary(*_date_range())
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/reports/brands', methods=['GET'])
+def brand_report():
+    """Bags requested vs delivered per brand over an optional date range"""
+    try:
+        return jsonify({
+            "success": True,
+            "data": Reports.summary(*_date_range())["brands"]
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/reports/hourly', methods=['GET'])
+def hourly_report():
+    """Vehicles per arrival hour over an optional date range"""
     try:
-        Database.delete_process(token_number)
         return jsonify({
             "success": True,
-            "message": "Process deleted successfully"
+            "data": Reports.summary(*_date_range())["hourly"]
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/reports/dwell', methods=['GET'])
+def dwell_report():
+    """Average minutes between arrival and way out over an optional date range"""
+    try:
+        summary = Reports.summary(*_date_range())
+        return jsonify({
+            "success": True,
+            "data": {
+                "average_dwell_minutes": summary["average_dwell_minutes"],
+                "vehicles": summary["vehicles"]
+            }
+        })
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/reports/rebuild', methods=['POST'])
+def rebuild_reports():
+    """Recompute all rollups from the full history"""
+    try:
+        rollups = Database.rebuild_reports()
+        return jsonify({
+            "success": True,
+            "message": "Reports rebuilt successfully",
+            "count": len(rollups)
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -314,31 +539,133 @@ def delete_process(token_number):
 
 @app.route('/api/export/excel', methods=['GET'])
 def export_excel():
-    """Export all process data to Excel"""
+    """Export process data to Excel (all history, or an optional 'from'/'to' date range)"""
     try:
-        processes = Database.get_all_processes()
+        start_date, end_date = _date_range()
+        cache_key = ExcelHandler.cache_key(Database.get_revision(), start_date, end_date)
         
-        if not processes:
+        # Unchanged data: serve the previous export for the same revision and range
+        filepath = ExcelHandler.get_cached_export(cache_key)
+        if not filepath:
+            revision, processes = Database.get_snapshot(start_date, end_date)
+            
+            if not processes:
+                return jsonify({
+                    "success": False,
+                    "error": "No data to export"
+                }), 400
+            
+            cache_key = ExcelHandler.cache_key(revision, start_date, end_date)
+            filepath = ExcelHandler.export_to_excel(processes, cache_key)
+        
+        if filepath and os.path.exists(filepath):
+            return send_file(
+                filepath,
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                as_attachment=True,
+                download_name=os.path.basename(filepath)
+            )
+        else:
             return jsonify({
                 "success": False,
-                "error": "No data to export"
+                "error": "Failed to generate Excel file"
+            }), 500
+    
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    """
+    Export process data in a chosen format
+    Query parameters: 'format' (xlsx, csv or parquet; default xlsx) and
+    optional 'from'/'to' dates (YYYY-MM-DD). CSV is streamed as it is written.
+    """
+    try:
+        export_format = request.args.get('format', 'xlsx').lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({
+                "success": False,
+                "error": f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}"
             }), 400
         
-        filepath = ExcelHandler.export_to_excel(processes)
+        if export_format == 'xlsx':
+            return export_excel()
+        
+        start_date, end_date = _date_range()
+        load_processes = lambda: Database.iter_processes(start_date, end_date)
+        
+        if export_format == 'csv':
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            return Response(
+                stream_with_context(ExcelHandler.stream_csv(load_processes)),
+                mimetype=EXPORT_FORMATS['csv'],
+                headers={"Content-Disposition": f"attachment; filename=process_data_{timestamp}.csv"}
+            )
+        
+        cache_key = ExcelHandler.cache_key(Database.get_revision(), start_date, end_date, export_format)
+        filepath = ExcelHandler.get_cached_export(cache_key)
+        if not filepath:
+            filepath = ExcelHandler.export_to_parquet(load_processes, cache_key)
         
         if filepath and os.path.exists(filepath):
             return send_file(
                 filepath,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                mimetype=EXPORT_FORMATS['parquet'],
                 as_attachment=True,
                 download_name=os.path.basename(filepath)
             )
         else:
             return jsonify({
                 "success": False,
-                "error": "Failed to generate Excel file"
-            }), 500
+                "error": "No data to export"
+            }), 400
     
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/export/jobs', methods=['POST'])
+def create_export_job():
+    """
+    Start a background Excel export
+    Optional 'from'/'to' (YYYY-MM-DD) query parameters limit the range;
+    an export for an unchanged revision and range is returned from cache
+    """
+    try:
+        start_date, end_date = _date_range()
+        job = ExcelHandler.submit_export(
+            Database.get_revision(), start_date, end_date,
+            lambda: Database.get_snapshot(start_date, end_date)
+        )
+        return jsonify({
+            "success": True,
+            "data": job
+        }), 200 if job["status"] == "done" else 202
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/export/jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """Poll a background export job; a finished job includes its download URL"""
+    try:
+        job = ExcelHandler.get_job(job_id)
+        if not job:
+            return jsonify({"success": False, "error": "Job not found"}), 404
+        if job["status"] == "done":
+            job["download_url"] = f"/api/export/download/{job['filename']}"
+        return jsonify({
+            "success": True,
+            "data": job
+        })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -430,9 +757,10 @@ def download_export(filename):
             return jsonify({"success": False, "error": "Invalid file"}), 400
         
         if os.path.exists(export_path):
+            extension = os.path.splitext(filename)[1].lstrip('.')
             return send_file(
                 export_path,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                mimetype=EXPORT_FORMATS.get(extension, 'application/octet-stream'),
                 as_attachment=True,
                 download_name=filename
             )
@@ -0,0 +1,543 @@
+"""
+Offline batch processing of recorded gate footage
+
+Runs plate detection and OCR over video files and/or image directories
+without a display, and writes:
+  - frames.jsonl / frames.csv    the plates read in each frame
+  - vehicles.jsonl / vehicles.csv one record per vehicle pass (consensus plate)
+
+Frames are decoded on a reader thread and processed by a pool of worker
+processes. Progress is checkpointed, so an interrupted run continues where
+it stopped with --resume.
+
+Example:
+    python batch.py recordings/gate_2026-10-18.mp4 CarPictures --output ./Output/batch --workers 6
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from plate_quality import assess_plate, correct_skew, box_iou
+
+# ------------------------------
+# DEFAULTS
+# ------------------------------
+MODEL_PATH = "best.pt"
+TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+FRAME_SIZE = (320, 256)         # Same detection size as the live pipeline
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".wmv")
+QUEUE_SIZE = 64                 # Decoded frames buffered ahead of the workers
+CHECKPOINT_EVERY = 200          # Processed frames between checkpoints
+REPORT_EVERY = 10.0             # Seconds between throughput reports
+VEHICLE_GAP = 5.0               # Seconds without a sighting that end a vehicle pass
+
+FRAME_COLUMNS = ["source", "frame", "file", "offset_seconds", "captured_at", "plate", "raw_text",
+                 "confidence", "quality", "x1", "y1", "x2", "y2"]
+VEHICLE_COLUMNS = ["source", "plate", "votes", "frames", "first_seen", "last_seen",
+                   "first_offset", "last_offset", "best_confidence"]
+
+
+# ------------------------------
+# WORKER PROCESS (DETECTION + OCR)
+# ------------------------------
+_model = None
+_reader = None
+_conf = 0.4
+_deskew = True
+
+
+def _init_worker(model_path, conf, deskew):
+    """Load YOLO and the OCR engines once per worker process"""
+    global _model, _reader, _conf, _deskew
+    os.environ["YOLO_VERBOSE"] = "False"
+    # One thread per process, the pool provides the parallelism
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    from ultralytics import YOLO
+    import easyocr
+    import pytesseract
+
+    if os.path.exists(TESSERACT_CMD):
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+    _model = YOLO(model_path)
+    _reader = easyocr.Reader(['en'], verbose=False)
+    _conf = conf
+    _deskew = deskew
+
+
+def format_plate(p):
+    """Format Sri Lankan number plate"""
+    p = p.upper()
+    p = "".join(c for c in p if c.isalnum())
+
+    match = re.match(r'([A-Z]{1,3})([A-Z]{0,3})(\d{3,4})', p)
+    if match:
+        return " ".join([x for x in match.groups() if x])
+    return p
+
+
+def preprocess_for_ocr(img):
+    """Preprocess image for OCR (same pipeline as the API, without debug output files)"""
+    plate_big = cv2.resize(img, None, fx=3, fy=3, interpolation=cv2.INTER_CUBIC)
+    gray = cv2.cvtColor(plate_big, cv2.COLOR_BGR2GRAY)
+
+    gray = cv2.bilateralFilter(gray, 15, 25, 25)
+
+    kernel_sharp = np.array([[0, -1, 0],
+                             [-1, 5, -1],
+                             [0, -1, 0]])
+    sharp = cv2.filter2D(gray, -1, kernel_sharp)
+
+    th = cv2.adaptiveThreshold(sharp, 255,
+                               cv2.ADAPTIVE_THRESH_MEAN_C,
+                               cv2.THRESH_BINARY_INV,
+                               41, 15)
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+    return cv2.morphologyEx(th, cv2.MORPH_CLOSE, kernel, iterations=2)
+
+
+def read_plate_text(clean):
+    """Read text from plate"""
+    import pytesseract
+
+    easy = _reader.readtext(clean)
+    easy_text = "".join([d[1] for d in easy])
+
+    tess_text = pytesseract.image_to_string(
+        clean,
+        config="--oem 3 --psm 7 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    )
+
+    combined = (easy_text + tess_text).upper()
+    return "".join(c for c in combined if c.isalnum())
+
+
+def process_frame(item):
+    """
+    Detect and read the plates in one frame (runs in a worker process)
+    A failure is recorded on the item as 'error', so one bad frame doesn't stop the run
+    """
+    frame = item.pop("image")
+    scale = item.pop("scale")
+    try:
+        item["detections"] = _read_plates(frame, scale)
+    except Exception as e:
+        item["detections"] = []
+        item["error"] = str(e)
+    return item
+
+
+def _read_plates(frame, scale):
+    """Detected plates with their OCR readings; 'scale' maps back to the original frame"""
+    results = _model.predict(frame, conf=_conf, verbose=False)
+    detections = []
+
+    for r in results:
+        for box in r.boxes:
+            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
+            plate = frame[y1:y2, x1:x2]
+            if plate.size == 0:
+                continue
+
+            quality = assess_plate(plate, scale)
+            if not quality["ok"]:
+                continue
+            if _deskew:
+                plate = correct_skew(plate, quality["skew"])
+
+            raw_text = read_plate_text(preprocess_for_ocr(plate))
+            detections.append({
+                "bbox": [int(x1), int(y1), int(x2), int(y2)],
+                "raw_text": raw_text,
+                "plate": format_plate(raw_text),
+                "confidence": float(box.conf[0].cpu().numpy()),
+                "quality": quality["score"],
+            })
+    return detections
+
+
+# ------------------------------
+# FRAME READER THREAD
+# ------------------------------
+def list_sources(paths):
+    """Expand the command line paths into video files and image directories"""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.append(("images", os.path.abspath(path)))
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            sources.append(("video", os.path.abspath(path)))
+        else:
+            print(f"Skipping unsupported input: {path}")
+    return sources
+
+
+def _scale(frame):
+    """Factor from the detection frame back to the original frame, per axis"""
+    return (frame.shape[1] / FRAME_SIZE[0], frame.shape[0] / FRAME_SIZE[1])
+
+
+def _video_frames(path, start, stride, start_time):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print(f"Could not open video: {path}")
+        return
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    if start_time is None and total:
+        # Recorders finish writing the file when the recording ends
+        start_time = datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=total / fps)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    index = start
+    try:
+        while True:
+            # grab() skips frames without decoding them
+            if (index - start) % stride:
+                if not cap.grab():
+                    break
+                index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            offset = index / fps
+            captured_at = (start_time + timedelta(seconds=offset)).isoformat() if start_time else None
+            yield {
+                "frame": index,
+                "offset_seconds": round(offset, 3),
+                "captured_at": captured_at,
+                "frame_seconds": stride / fps,
+                "total": total,
+                "image": cv2.resize(frame, FRAME_SIZE),
+                "scale": _scale(frame),
+            }
+            index += 1
+    finally:
+        cap.release()
+
+
+def _image_frames(path, start):
+    files = sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+    for index in range(start, len(files)):
+        filepath = os.path.join(path, files[index])
+        frame = cv2.imread(filepath)
+        if frame is None:
+            continue
+        yield {
+            "frame": index,
+            "file": files[index],
+            "offset_seconds": None,
+            "captured_at": datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat(),
+            "frame_seconds": 0.0,
+            "total": len(files),
+            "image": cv2.resize(frame, FRAME_SIZE),
+            "scale": _scale(frame),
+        }
+
+
+def _read_frames(sources, checkpoint, stride, start_times, frames):
+    """
+    Decode frames from every source into the queue; None marks the end
+    start_times maps a video's path to the wall-clock time of its first frame
+    """
+    try:
+        for kind, path in sources:
+            state = checkpoint["sources"].get(path, {})
+            if state.get("done"):
+                continue
+            start = state.get("next_frame", 0)
+            if kind == "video":
+                items = _video_frames(path, start, stride, start_times.get(path))
+            else:
+                items = _image_frames(path, start)
+            for item in items:
+                item["source"] = path
+                frames.put(item)
+            frames.put({"source": path, "end": True})
+    except Exception as e:
+        print(f"Error reading frames: {e}")
+    finally:
+        frames.put(None)
+
+
+def _queued_frames(frames, in_flight):
+    """
+    Feed queued frames to the pool
+    Pool.imap reads its input eagerly, so the semaphore bounds how many
+    frames are waiting in the pool; a slot is freed per finished result
+    """
+    while True:
+        item = frames.get()
+        if item is None:
+            return
+        in_flight.acquire()
+        yield item
+
+
+def _skip_ends(item):
+    """End-of-source markers pass through the pool untouched"""
+    return item if item.get("end") else process_frame(item)
+
+
+# ------------------------------
+# VEHICLE GROUPING
+# ------------------------------
+def _sighting_time(item):
+    if item["offset_seconds"] is not None:
+        return item["offset_seconds"]
+    return datetime.fromisoformat(item["captured_at"]).timestamp()
+
+
+def update_vehicles(tracks, item):
+    """
+    Assign a frame's plates to vehicle passes (grouped by box overlap or
+    identical text) and return the passes that ended before this frame
+    """
+    now = _sighting_time(item)
+    for det in item["detections"]:
+        track = next((t for t in tracks if t["plate_votes"].get(det["plate"])
+                      or box_iou(t["bbox"], det["bbox"]) >= 0.3), None)
+        if track is None:
+            track = {
+                "source": item["source"], "bbox": det["bbox"], "plate_votes": {},
+                "frames": 0, "first_time": now, "first_seen": item["captured_at"],
+                "first_offset": item["offset_seconds"], "best_confidence": 0.0,
+            }
+            tracks.append(track)
+        track["bbox"] = det["bbox"]
+        track["plate_votes"][det["plate"]] = track["plate_votes"].get(det["plate"], 0) + 1
+        track["frames"] += 1
+        track["last_time"] = now
+        track["last_seen"] = item["captured_at"]
+        track["last_offset"] = item["offset_seconds"]
+        track["best_confidence"] = max(track["best_confidence"], det["confidence"])
+
+    ended = [t for t in tracks if now - t["last_time"] > VEHICLE_GAP]
+    tracks[:] = [t for t in tracks if now - t["last_time"] <= VEHICLE_GAP]
+    return ended
+
+
+def vehicle_record(track):
+    """Summarize a vehicle pass with the plate text most frames agreed on"""
+    plate, votes = Counter(track["plate_votes"]).most_common(1)[0]
+    return {
+        "source": track["source"],
+        "plate": plate,
+        "votes": votes,
+        "frames": track["frames"],
+        "first_seen": track["first_seen"],
+        "last_seen": track["last_seen"],
+        "first_offset": track["first_offset"],
+        "last_offset": track["last_offset"],
+        "best_confidence": round(track["best_confidence"], 4),
+    }
+
+
+# ------------------------------
+# OUTPUT + CHECKPOINT
+# ------------------------------
+class ResultWriter:
+    """Append-only JSONL/CSV writer that can be truncated back to a checkpoint"""
+
+    def __init__(self, path, columns, output_format, offset=None):
+        self.path = path
+        self.columns = columns
+        self.format = output_format
+        # A fresh run starts a new file; a resumed one appends after the checkpoint
+        self.file = open(path, "w" if offset is None else "a+", newline="")
+        if offset is not None:
+            # Drop anything written after the last checkpoint
+            self.file.truncate(offset)
+            self.file.seek(offset)
+        self.csv = csv.DictWriter(self.file, fieldnames=columns, extrasaction="ignore") if output_format == "csv" else None
+        if self.csv and self.file.tell() == 0:
+            self.csv.writeheader()
+
+    def write(self, record):
+        if self.csv:
+            self.csv.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + "\n")
+
+    def offset(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return None
+
+
+def save_checkpoint(path, checkpoint):
+    # Write to a temp file first so a crash never leaves a half-written checkpoint
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temp, path)
+
+
+# ------------------------------
+# MAIN
+# ------------------------------
+def run(args):
+    os.makedirs(args.output, exist_ok=True)
+    checkpoint_path = os.path.join(args.output, "checkpoint.json")
+    checkpoint = load_checkpoint(checkpoint_path) if args.resume else None
+    if checkpoint is None:
+        checkpoint = {"sources": {}, "outputs": {}, "tracks": []}
+
+    ext = "csv" if args.format == "csv" else "jsonl"
+    frames_out = ResultWriter(os.path.join(args.output, f"frames.{ext}"), FRAME_COLUMNS,
+                              args.format, checkpoint["outputs"].get("frames"))
+    vehicles_out = ResultWriter(os.path.join(args.output, f"vehicles.{ext}"), VEHICLE_COLUMNS,
+                                args.format, checkpoint["outputs"].get("vehicles"))
+    tracks = checkpoint["tracks"]
+
+    def write_checkpoint():
+        checkpoint["outputs"] = {"frames": frames_out.offset(), "vehicles": vehicles_out.offset()}
+        checkpoint["tracks"] = tracks
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    sources = list_sources(args.inputs)
+    frames = queue.Queue(maxsize=QUEUE_SIZE)
+    in_flight = threading.Semaphore(QUEUE_SIZE)
+    reader = threading.Thread(target=_read_frames, daemon=True,
+                              args=(sources, checkpoint, args.stride, args.start_times, frames))
+    reader.start()
+
+    processed = 0
+    errors = 0
+    media_seconds = 0.0
+    started = last_report = time.time()
+
+    with multiprocessing.Pool(args.workers, initializer=_init_worker,
+                              initargs=(args.model, args.conf, not args.no_deskew)) as pool:
+        # imap keeps frame order, so everything before a result is finished too
+        for item in pool.imap(_skip_ends, _queued_frames(frames, in_flight), chunksize=4):
+            in_flight.release()
+            source = item["source"]
+            if item.get("end"):
+                for track in [t for t in tracks if t["source"] == source]:
+                    vehicles_out.write(vehicle_record(track))
+                tracks[:] = [t for t in tracks if t["source"] != source]
+                checkpoint["sources"][source] = {"done": True}
+                write_checkpoint()
+                print(f"Finished {source}")
+                continue
+
+            if item.get("error"):
+                errors += 1
+                print(f"Error in {os.path.basename(source)} frame {item['frame']}: {item['error']}")
+
+            if args.format == "csv":
+                # One row per plate
+                for det in item["detections"]:
+                    x1, y1, x2, y2 = det["bbox"]
+                    frames_out.write({
+                        "source": source, "frame": item["frame"], "file": item.get("file"),
+                        "offset_seconds": item["offset_seconds"], "captured_at": item["captured_at"], "plate": det["plate"], "raw_text": det["raw_text"],
+                        "confidence": round(det["confidence"], 4), "quality": det["quality"],
+                        "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                    })
+            elif item["detections"] or item.get("error"):
+                # One record per frame with all of its plates (failed frames keep their error)
+                record = {
+                    "source": source, "frame": item["frame"], "file": item.get("file"),
+                    "offset_seconds": item["offset_seconds"], "captured_at": item["captured_at"],
+                    "detections": item["detections"],
+                }
+                if item.get("error"):
+                    record["error"] = item["error"]
+                frames_out.write(record)
+
+            for track in update_vehicles(tracks, item):
+                vehicles_out.write(vehicle_record(track))
+
+            processed += 1
+            media_seconds += item["frame_seconds"]
+            checkpoint["sources"][source] = {"next_frame": item["frame"] + 1}
+            if processed % CHECKPOINT_EVERY == 0:
+                write_checkpoint()
+
+            now = time.time()
+            if now - last_report >= REPORT_EVERY:
+                elapsed = now - started
+                speed = f", {media_seconds / elapsed:.1f}x real time" if media_seconds else ""
+                print(f"{processed} frames in {elapsed:.0f}s ({processed / elapsed:.1f} fps{speed}) "
+                      f"- {os.path.basename(source)} frame {item['frame']}/{item['total']}")
+                last_report = now
+
+    for track in tracks:
+        vehicles_out.write(vehicle_record(track))
+    tracks.clear()
+    write_checkpoint()
+    frames_out.close()
+    vehicles_out.close()
+
+    elapsed = max(time.time() - started, 1e-6)
+    print(f"Done: {processed} frames in {elapsed:.1f}s ({processed / elapsed:.1f} fps)")
+    if errors:
+        print(f"{errors} frames failed, see the errors above")
+    if media_seconds:
+        print(f"Footage processed: {media_seconds:.0f}s ({media_seconds / elapsed:.1f}x real time)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Batch number plate detection over recorded footage")
+    parser.add_argument("inputs", nargs="+", help="Video files and/or directories of images")
+    parser.add_argument("--output", default="./Output/batch", help="Directory for results and the checkpoint")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl", help="Output file format")
+    parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() - 1),
+                        help="Detection/OCR worker processes")
+    parser.add_argument("--stride", type=int, default=1, help="Process every Nth video frame")
+    parser.add_argument("--start-time", nargs="+", default=[],
+                        help="Wall-clock time of the first frame of each video, in input order (ISO format); "
+                             "defaults to the file's modification time minus its duration")
+    parser.add_argument("--model", default=MODEL_PATH, help="YOLO model weights")
+    parser.add_argument("--conf", type=float, default=0.4, help="Detection confidence threshold")
+    parser.add_argument("--no-deskew", action="store_true", help="Do not rotate skewed plates before OCR")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint in the output directory")
+    args = parser.parse_args()
+    args.stride = max(1, args.stride)
+
+    videos = [os.path.abspath(p) for p in args.inputs
+              if not os.path.isdir(p) and p.lower().endswith(VIDEO_EXTENSIONS)]
+    if args.start_time and len(args.start_time) != len(videos):
+        parser.error(f"--start-time needs one value per input video ({len(videos)} videos given)")
+    try:
+        args.start_times = dict(zip(videos, map(datetime.fromisoformat, args.start_time)))
+    except ValueError as e:
+        parser.error(f"--start-time: {e}")
+    return args
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -1,30 +1,177 @@
 import json
 import os
+import re
+import threading
+from collections import deque
 from datetime import datetime
+from functools import wraps
 from pathlib import Path
+from reports import Reports
 
 # Database file path
 DB_PATH = "./Database/data.json"
 BACKUP_PATH = "./Database/backups"
+ARCHIVE_PATH = "./Database/archive"
 
 # Ensure directories exist
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 os.makedirs(BACKUP_PATH, exist_ok=True)
+os.makedirs(ARCHIVE_PATH, exist_ok=True)
+
+# Token prefix for each category (kept in sync with the frontend form categories)
+TOKEN_PREFIXES = {
+    'Marine plus': 'MP',
+    'Sanstha': 'S',
+    'Mahamera': 'MM',
+    'Scamale': 'WH',
+    'red slow': 'R',
+    'Bulk': 'B'
+}
+DEFAULT_TOKEN_PREFIX = 'XX'
+
+# Number of recent changes kept in memory for the change feed
+CHANGE_LOG_SIZE = 1000
+
+# Characters OCR commonly confuses on plates, folded onto one symbol for matching
+PLATE_CONFUSIONS = str.maketrans({
+    'O': '0', 'Q': '0', 'D': '0',
+    'I': '1', 'L': '1',
+    'B': '8',
+    'S': '5',
+    'Z': '2',
+    'G': '6',
+})
+
+# Serializes read-modify-write cycles on the data file across request threads
+_lock = threading.RLock()
+
+# Change feed: recent changes, latest revision, and a condition to wake up listeners
+_changes = deque(maxlen=CHANGE_LOG_SIZE)
+_changes_ready = threading.Condition(_lock)
+_revision = 0
+
+# Rewrites of earlier days' partitions, so exports can read them without the lock
+_past_edits = 0
+
+# Vehicle index over the open queue, rebuilt when the revision moves on
+_vehicle_index = None
+_vehicle_index_revision = None
+
+
+def _locked(func):
+    """Run a database operation while holding the write lock"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def normalize_plate(plate):
+    """Uppercase a vehicle number and keep only letters and digits"""
+    return "".join(c for c in str(plate or "").upper() if c.isalnum())
+
+
+def plate_key(plate):
+    """Matching key for a vehicle number, with OCR-confusable characters folded together"""
+    return normalize_plate(plate).translate(PLATE_CONFUSIONS)
+
+
+def _edit_distance(a, b, limit):
+    """Levenshtein distance between two strings, or limit + 1 once it is exceeded"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _bigrams(key):
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+class VehicleIndex:
+    """
+    In-memory index of the open queue by vehicle number.
+    
+    Exact matches on the folded key are a dictionary lookup; fuzzy matches
+    only compare against keys that share enough bigrams with the query.
+    """
+    
+    def __init__(self, processes):
+        self.by_key = {}
+        self.by_bigram = {}
+        for process in processes:
+            key = plate_key(process.get("vehicleNumber") or (process.get("waitIn") or {}).get("vehicleNumber"))
+            if not key:
+                continue
+            self.by_key.setdefault(key, []).append(process)
+            for gram in _bigrams(key):
+                self.by_bigram.setdefault(gram, set()).add(key)
+    
+    def find(self, plate, max_distance=1):
+        """Processes whose vehicle number matches a plate read, closest first"""
+        query = plate_key(plate)
+        if not query:
+            return []
+        if query in self.by_key:
+            return list(self.by_key[query])
+        
+        grams = _bigrams(query)
+        shared = {}
+        for gram in grams:
+            for key in self.by_bigram.get(gram, ()):
+                shared[key] = shared.get(key, 0) + 1
+        
+        # Each edit changes at most two bigrams; a dropped two-letter province
+        # prefix (e.g. "WP") costs two more
+        min_shared = max(1, len(grams) - 2 * max_distance - 2)
+        
+        scored = []
+        for key, count in shared.items():
+            if count < min_shared:
+                continue
+            distance = _edit_distance(query, key, max_distance)
+            shorter, longer = sorted((query, key), key=len)
+            if len(shorter) >= 5 and longer.endswith(shorter):
+                distance = 0
+            if distance <= max_distance:
+                scored.append((distance, key))
+        
+        matches = []
+        for distance, key in sorted(scored):
+            matches.extend(self.by_key[key])
+        return matches
 
 
 class Database:
     """Simple JSON-based database for process queue data"""
     
     @staticmethod
+    @_locked
     def initialize():
         """Initialize database with empty structure if it doesn't exist"""
+        global _revision
         if not os.path.exists(DB_PATH):
             initial_data = {
                 "processes": [],
                 "daily_tokens": {},
+                "revision": 0,
                 "last_updated": datetime.now().isoformat()
             }
             Database.save(initial_data)
+        else:
+            # Roll completed processes and stale token counters out of the live file
+            Database.archive_completed()
+        _revision = Database.load().get("revision", 0)
+        if not Reports.exists():
+            Database.rebuild_reports()
     
     @staticmethod
     def load():
@@ -52,50 +199,446 @@ class Database:
             return False
     
     @staticmethod
+    @_locked
     def add_process(process_data):
         """Add a new process entry"""
         data = Database.load()
+        Database._reserve_token(data, process_data.get("tokenNumber"))
+        return Database._insert_process(data, process_data)
+    
+    @staticmethod
+    def _insert_process(data, process_data):
+        """Stamp a new process, store it in loaded data and save (write lock must be held)"""
         process_data["id"] = str(datetime.now().timestamp())  # Unique ID
         process_data["created_at"] = datetime.now().isoformat()
-        data["processes"].insert(0, process_data)  # Add to front
+        if Database._is_completed(process_data):
+            Database._archive(process_data)
+        else:
+            data["processes"].insert(0, process_data)  # Add to front
+        Database._record_change(data, "insert", process_data)
         Database.save(data)
+        Reports.apply(Database._partition_day(process_data), after=Reports.contribution(process_data))
         return process_data
     
     @staticmethod
-    def update_process(token_number, updated_data):
-        """Update an existing process entry"""
+    @_locked
+    def update_process(token_number, updated_data, day=None):
+        """
+        Update an existing process entry
+        'day' optionally picks the process's partition day (see _matches)
+        """
         data = Database.load()
         for i, process in enumerate(data["processes"]):
+            if Database._matches(process, token_number, day):
+                before_day = Database._partition_day(process)
+                before = Reports.contribution(process)
+                process.update(updated_data)
+                process["updated_at"] = datetime.now().isoformat()
+                if Database._is_completed(process):
+                    # Finished processes leave the live working set
+                    data["processes"].pop(i)
+                    Database._archive(process)
+                Database._record_change(data, "update", process)
+                Database.save(data)
+                after_day = Database._partition_day(process)
+                if after_day == before_day:
+                    Reports.apply(after_day, before, Reports.contribution(process))
+                else:
+                    # Finishing on a later day moves the visit to its completion day
+                    Reports.apply(before_day, before=before)
+                    Reports.apply(after_day, after=Reports.contribution(process))
+                return process
+        
+        # Fall back to the archive for edits to already finished processes
+        archive_day, archived = Database._find_archived(token_number, day)
+        for process in archived:
             if process.get("tokenNumber") == token_number:
-                data["processes"][i].update(updated_data)
-                data["processes"][i]["updated_at"] = datetime.now().isoformat()
+                before = Reports.contribution(process)
+                process.update(updated_data)
+                process["updated_at"] = datetime.now().isoformat()
+                Database._write_partition(archive_day, archived)
+                Database._record_change(data, "update", process)
                 Database.save(data)
-                return data["processes"][i]
+                Reports.apply(archive_day, before, Reports.contribution(process))
+                return process
         return None
     
     @staticmethod
     def get_all_processes():
-        """Get all process entries"""
-        data = Database.load()
-        return data.get("processes", [])
+        """Get all process entries, including every archived partition"""
+        return list(Database.iter_processes())
+    
+    @staticmethod
+    def iter_processes(start_date=None, end_date=None):
+        """
+        Iterate over stored processes in an optional date range (unbounded by default).
+        
+        Archive partitions are read one day at a time, so large extracts
+        never hold the whole history in memory.
+        """
+        for process in Database.load().get("processes", []):
+            if Database._in_range(Database._partition_day(process), start_date, end_date):
+                yield process
+        for day in reversed(Database.list_partitions()):
+            if Database._in_range(day, start_date, end_date):
+                yield from Database.load_partition(day)
     
     @staticmethod
-    def get_process_by_token(token_number):
-        """Get a specific process by token number"""
+    def _in_range(day, start_date=None, end_date=None):
+        """Whether an ISO day falls in an optional date range (both ends inclusive)"""
+        return (start_date is None or day >= start_date) and (end_date is None or day <= end_date)
+    
+    @staticmethod
+    def get_processes(start_date=None, end_date=None):
+        """
+        Get the working set, or a date range of processes.
+        
+        Without a range this returns every open process, whatever day it was
+        created, plus the processes finished today. Dates are ISO strings
+        (YYYY-MM-DD) and only the matching archive partitions are read.
+        """
+        if start_date is None and end_date is None:
+            return Database.load().get("processes", []) + Database.load_partition(Database._today())
+        return list(Database.iter_processes(start_date, end_date))
+    
+    @staticmethod
+    def get_snapshot(start_date=None, end_date=None):
+        """
+        Processes in an optional date range (the full history by default),
+        together with the revision they were read at
+        
+        Only the live queue and today's partition are read under the write
+        lock; earlier days are read outside it, so a long export never holds
+        up the gate. If one of those is rewritten meanwhile, the read is retried.
+        """
+        while True:
+            with _lock:
+                revision, edits, today = _revision, _past_edits, Database._today()
+                processes = [
+                    p for p in Database.load().get("processes", [])
+                    if Database._in_range(Database._partition_day(p), start_date, end_date)
+                ]
+                days = [d for d in reversed(Database.list_partitions()) if Database._in_range(d, start_date, end_date)]
+                for day in days:
+                    if day >= today:
+                        processes.extend(Database.load_partition(day))
+            
+            for day in days:
+                if day < today:
+                    processes.extend(Database.load_partition(day))
+            
+            with _lock:
+                if _past_edits == edits:
+                    return revision, processes
+    
+    @staticmethod
+    def get_process_by_token(token_number, day=None):
+        """Get a specific process by token number, optionally on a given partition day"""
         data = Database.load()
         for process in data.get("processes", []):
+            if Database._matches(process, token_number, day):
+                return process
+        for process in Database._find_archived(token_number, day)[1]:
             if process.get("tokenNumber") == token_number:
                 return process
         return None
     
     @staticmethod
-    def delete_process(token_number):
-        """Delete a process entry"""
+    @_locked
+    def delete_process(token_number, day=None):
+        """
+        Delete a process entry, optionally on a given partition day
+        Returns False if no process has the token
+        """
         data = Database.load()
-        data["processes"] = [p for p in data.get("processes", []) if p.get("tokenNumber") != token_number]
+        removed = [p for p in data.get("processes", []) if Database._matches(p, token_number, day)]
+        data["processes"] = [p for p in data.get("processes", []) if not Database._matches(p, token_number, day)]
+        
+        if not removed:
+            archive_day, archived = Database._find_archived(token_number, day)
+            removed = [p for p in archived if p.get("tokenNumber") == token_number]
+            if removed:
+                Database._write_partition(archive_day, [p for p in archived if p.get("tokenNumber") != token_number])
+        
+        if not removed:
+            return False
+        Database._record_change(data, "delete", {"tokenNumber": token_number})
         Database.save(data)
+        for process in removed:
+            Reports.apply(Database._partition_day(process), before=Reports.contribution(process))
         return True
     
+    @staticmethod
+    def _matches(process, token_number, day=None):
+        """
+        Whether a process has a token, and optionally a partition day
+        (completion day for finished processes, creation day for open ones)
+        """
+        return process.get("tokenNumber") == token_number and (day is None or Database._partition_day(process) == day)
+    
+    @staticmethod
+    def _find_archived(token_number, day=None):
+        """
+        Find the partition holding a finished process: the given day, or else
+        the most recent partition with the token (tokens restart every day)
+        Returns (day, processes of that partition), or (None, []) if not archived
+        """
+        for partition_day in ([day] if day else reversed(Database.list_partitions())):
+            archived = Database.load_partition(partition_day)
+            if any(p.get("tokenNumber") == token_number for p in archived):
+                return partition_day, archived
+        return None, []
+    
+    # ==================== VEHICLE LOOKUP ====================
+    
+    @staticmethod
+    @_locked
+    def find_open_by_vehicle(plate, max_distance=1):
+        """
+        Find open processes for a detected plate, tolerating OCR confusions.
+        
+        Exact matches (after folding O/0, I/1, B/8 and similar) are returned
+        alone; otherwise plates within max_distance edits, closest first.
+        """
+        global _vehicle_index, _vehicle_index_revision
+        if _vehicle_index is None or _vehicle_index_revision != _revision:
+            _vehicle_index = VehicleIndex(Database.load().get("processes", []))
+            _vehicle_index_revision = _revision
+        return _vehicle_index.find(plate, max_distance)
+    
+    # ==================== DAILY TOKENS ====================
+    
+    @staticmethod
+    def _token_prefix(category):
+        """Token prefix for a category, matched case-insensitively"""
+        for name, prefix in TOKEN_PREFIXES.items():
+            if name.lower() == (category or "").lower():
+                return prefix
+        return DEFAULT_TOKEN_PREFIX
+    
+    @staticmethod
+    def _highest_issued(prefix, processes):
+        """Highest token number already used for a prefix among the given processes"""
+        pattern = re.compile(rf"^{re.escape(prefix)}-(\d+)$")
+        highest = 0
+        for process in processes:
+            match = pattern.match(process.get("tokenNumber") or "")
+            if match:
+                highest = max(highest, int(match.group(1)))
+        return highest
+    
+    @staticmethod
+    def _allocate_token(data, category):
+        """
+        Increment today's counter for a category inside loaded data and return the token.
+        
+        A counter missing for today is seeded from the tokens in use: every
+        open process (including ones carried over from earlier days, which
+        keep their tokens) and today's finished processes.
+        """
+        prefix = Database._token_prefix(category)
+        counts = Database._token_counts(data, prefix)
+        counts[prefix] += 1
+        return f"{prefix}-{counts[prefix]:02d}"
+    
+    @staticmethod
+    def _token_counts(data, prefix):
+        """Today's token counters inside loaded data, with the one for a prefix seeded"""
+        today = Database._today()
+        if today not in data.get("daily_tokens", {}):
+            # Counters restart every day, so earlier days' are dropped here
+            # rather than piling up on a server that is never restarted
+            data["daily_tokens"] = {today: {}}
+        counts = data["daily_tokens"][today]
+        if prefix not in counts:
+            in_use = data.get("processes", []) + Database.load_partition(today)
+            counts[prefix] = Database._highest_issued(prefix, in_use)
+        return counts
+    
+    @staticmethod
+    def _reserve_token(data, token_number):
+        """Raise today's counter past a client-supplied token, so it is never issued again"""
+        match = re.match(r"^([A-Z]+)-(\d+)$", token_number or "")
+        if not match:
+            return
+        prefix, number = match.group(1), int(match.group(2))
+        counts = Database._token_counts(data, prefix)
+        counts[prefix] = max(counts[prefix], number)
+    
+    @staticmethod
+    @_locked
+    def create_process_with_token(process_data):
+        """Add a new process and assign its daily token in a single write"""
+        data = Database.load()
+        category = process_data.get("category") or (process_data.get("waitIn") or {}).get("category")
+        process_data["tokenNumber"] = Database._allocate_token(data, category)
+        return Database._insert_process(data, process_data)
+    
+    @staticmethod
+    @_locked
+    def rebuild_reports():
+        """Recompute the report rollups from every stored process"""
+        return Reports.rebuild(Database.get_all_processes(), Database._partition_day)
+    
+    # ==================== CHANGE FEED ====================
+    
+    @staticmethod
+    def _record_change(data, op, process):
+        """
+        Bump the revision in loaded data and publish a change to the feed.
+        
+        Must be called while holding the write lock, before the data is saved.
+        """
+        global _revision
+        _revision = data.get("revision", 0) + 1
+        data["revision"] = _revision
+        _changes.append({
+            "revision": _revision,
+            "op": op,
+            "tokenNumber": process.get("tokenNumber"),
+            "data": process if op != "delete" else None,
+        })
+        _changes_ready.notify_all()
+    
+    @staticmethod
+    def get_revision():
+        """Latest database revision"""
+        return _revision
+    
+    @staticmethod
+    @_locked
+    def get_changes(since):
+        """
+        Get the changes made after a revision.
+        
+        Returns (revision, changes, complete). 'complete' is False when the
+        requested revision is older than the in-memory change log, in which
+        case the caller has to reload the full working set.
+        """
+        oldest = _changes[0]["revision"] if _changes else _revision + 1
+        complete = since == _revision or oldest - 1 <= since < _revision
+        changes = [c for c in _changes if c["revision"] > since] if complete else []
+        return _revision, changes, complete
+    
+    @staticmethod
+    @_locked
+    def wait_for_changes(since, timeout=None):
+        """Block until there are changes after a revision (or the timeout passes), then get them"""
+        _changes_ready.wait_for(lambda: _revision > since, timeout)
+        return Database.get_changes(since)
+    
+    # ==================== DAILY ARCHIVE PARTITIONS ====================
+    
+    @staticmethod
+    def _today():
+        """Today's date as an ISO string, used as the partition key"""
+        return datetime.now().date().isoformat()
+    
+    @staticmethod
+    def _is_completed(process):
+        """A process is completed once its wait out has been recorded"""
+        return bool(process.get("waitOut"))
+    
+    @staticmethod
+    def _partition_day(process):
+        """
+        Partition key (YYYY-MM-DD) of a process.
+        
+        Finished processes belong to the day they were completed, so a visit
+        that spans midnight is archived with the rest of that day's work;
+        open processes belong to the day they were created.
+        """
+        stamp = process.get("completed_at") or process.get("created_at")
+        if stamp:
+            return stamp[:10]
+        return Database._today()
+    
+    @staticmethod
+    def _partition_path(day):
+        """Path of the JSONL partition file for a day"""
+        return os.path.join(ARCHIVE_PATH, f"{day}.jsonl")
+    
+    @staticmethod
+    def _archive(process, completed_at=None):
+        """Stamp a finished process with its completion time and append it to that day's partition"""
+        process.setdefault("completed_at", completed_at or datetime.now().isoformat())
+        return Database._append_to_partition(process)
+    
+    @staticmethod
+    def _append_to_partition(process):
+        """Append a completed process to its day's partition"""
+        try:
+            with open(Database._partition_path(Database._partition_day(process)), 'a') as f:
+                f.write(json.dumps(process) + "\n")
+            return True
+        except Exception as e:
+            print(f"Error archiving process: {e}")
+            return False
+    
+    @staticmethod
+    def _write_partition(day, processes):
+        """Rewrite a partition (processes given newest first, as returned by load_partition)"""
+        global _past_edits
+        if day < Database._today():
+            _past_edits += 1
+        try:
+            with open(Database._partition_path(day), 'w') as f:
+                for process in reversed(processes):
+                    f.write(json.dumps(process) + "\n")
+            return True
+        except Exception as e:
+            print(f"Error writing partition {day}: {e}")
+            return False
+    
+    @staticmethod
+    def load_partition(day):
+        """Load the completed processes of one day, most recently finished first"""
+        path = Database._partition_path(day)
+        try:
+            if not os.path.exists(path):
+                return []
+            with open(path, 'r') as f:
+                processes = [json.loads(line) for line in f if line.strip()]
+            processes.reverse()
+            return processes
+        except Exception as e:
+            print(f"Error loading partition {day}: {e}")
+            return []
+    
+    @staticmethod
+    def list_partitions():
+        """List the days that have an archive partition, oldest first"""
+        try:
+            return sorted(
+                f[:-len(".jsonl")] for f in os.listdir(ARCHIVE_PATH) if f.endswith(".jsonl")
+            )
+        except Exception as e:
+            print(f"Error listing partitions: {e}")
+            return []
+    
+    @staticmethod
+    @_locked
+    def archive_completed():
+        """Move completed processes into their daily partitions and drop old token counters"""
+        data = Database.load()
+        processes = data.get("processes", [])
+        # The live list is newest first, partitions are appended oldest first
+        for process in reversed(processes):
+            if Database._is_completed(process):
+                # The last edit is the closest record of when it was finished
+                Database._archive(process, process.get("updated_at"))
+        active = [p for p in processes if not Database._is_completed(p)]
+        
+        today = Database._today()
+        daily_tokens = data.get("daily_tokens", {})
+        current_tokens = {day: counts for day, counts in daily_tokens.items() if day == today}
+        
+        if len(active) != len(processes) or len(current_tokens) != len(daily_tokens):
+            data["processes"] = active
+            data["daily_tokens"] = current_tokens
+            Database.save(data)
+        return len(processes) - len(active)
+    
     @staticmethod
     def backup():
         """Create a backup of the database"""
@@ -111,10 +654,15 @@ class Database:
             return None
     
     @staticmethod
+    @_locked
     def clear_all():
         """Clear all data (use with caution)"""
-        data = {"processes": [], "daily_tokens": {}, "last_updated": datetime.now().isoformat()}
+        data = {"processes": [], "daily_tokens": {}, "revision": _revision, "last_updated": datetime.now().isoformat()}
+        Database._record_change(data, "reset", {})
         Database.save(data)
+        Reports.clear()
+        for day in Database.list_partitions():
+            os.remove(Database._partition_path(day))
         return True
 
 
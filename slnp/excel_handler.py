@@ -1,76 +1,78 @@
 import pandas as pd
+import csv
+import io
 import json
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils.dataframe import dataframe_to_rows
+from models import ProcessRecord, to_number
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
 
 EXPORT_PATH = "./Database/exports"
+MANIFEST_PATH = os.path.join(EXPORT_PATH, "manifest.json")
+
+# Maximum number of export files kept in the exports folder
+EXPORT_RETENTION = 20
+# Maximum number of export jobs whose status is remembered
+JOB_HISTORY = 100
+
+# Rows buffered per chunk when streaming CSV / writing Parquet row groups
+CSV_CHUNK_ROWS = 1000
+PARQUET_CHUNK_ROWS = 10000
+
+# Supported export formats and their MIME types
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
 
 # Ensure export directory exists
 os.makedirs(EXPORT_PATH, exist_ok=True)
 
+# Background export jobs run one at a time, off the request thread
+_executor = ThreadPoolExecutor(max_workers=1)
+_jobs = {}
+_manifest_lock = threading.RLock()
+
 
 class ExcelHandler:
     """Handle Excel import/export operations"""
     
     @staticmethod
-    def export_to_excel(processes):
-        """Export process data to Excel"""
+    def export_to_excel(processes, cache_key=None):
+        """
+        Export process data to Excel
+        With a cache_key the file is recorded in the export manifest, so later
+        requests for the same key can reuse it
+        """
         try:
             if not processes:
                 return None
             
             # Flatten the nested data structure for Excel
-            rows = []
-            for process in processes:
-                # Extract wait_in data
-                wait_in = process.get("waitIn", {})
-                delivery_table = wait_in.get("deliveryTable", [])
-                
-                # Create a base row
-                base_row = {
-                    "Token Number": process.get("tokenNumber", ""),
-                    "Vehicle Number": process.get("vehicleNumber", ""),
-                    "Date": process.get("date", ""),
-                    "Arrival Time": process.get("arrivalTime", ""),
-                    "Status": process.get("status", ""),
-                    "Driver Name": wait_in.get("driverName", ""),
-                    "Driver Phone": wait_in.get("driverPhone", ""),
-                    "Driver Town": wait_in.get("driverTown", ""),
-                    "Driver License": wait_in.get("driverLicense", ""),
-                    "Driver Alcohol Test": wait_in.get("driverAlcoholTest", ""),
-                    "Helper Name": wait_in.get("helperName", ""),
-                    "Helper Identity": wait_in.get("helperIdentity", ""),
-                    "Helper Phone": wait_in.get("helperPhone", ""),
-                    "Helper Town": wait_in.get("helperTown", ""),
-                    "Helper Alcohol Test": wait_in.get("helperAlcoholTest", ""),
-                    "Vehicle Insurance": wait_in.get("vehicleInsurance", False),
-                    "Driver PPE Number": wait_in.get("driverPPENumber", ""),
-                    "Helper PPE Number": wait_in.get("helperPPENumber", ""),
-                }
-                
-                # Add delivery table data
-                for i, delivery in enumerate(delivery_table):
-                    base_row[f"{delivery.get('brand', 'Brand')} Requested"] = delivery.get("requestedBag", 0)
-                    base_row[f"{delivery.get('brand', 'Brand')} Delivered"] = delivery.get("deliveryBag", 0)
-                
-                # Add wait_out data if exists
-                wait_out = process.get("waitOut")
-                if wait_out:
-                    base_row["Departure Time"] = wait_out.get("wayoutTime", "")
-                    base_row["Total Issue"] = wait_out.get("totalIssue", "")
-                    base_row["Notes"] = wait_out.get("notes", "")
-                
-                rows.append(base_row)
+            rows = [ProcessRecord.from_dict(process).to_row() for process in processes]
             
             # Create DataFrame
             df = pd.DataFrame(rows)
             
             # Generate filename with timestamp
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"process_data_{timestamp}.xlsx"
+            if cache_key:
+                filename = f"process_data_{timestamp}_{cache_key}.xlsx"
+            else:
+                filename = f"process_data_{timestamp}.xlsx"
             filepath = os.path.join(EXPORT_PATH, filename)
             
             # Export to Excel
@@ -79,12 +81,104 @@ class ExcelHandler:
             # Format the Excel file
             ExcelHandler._format_excel(filepath)
             
+            ExcelHandler._register_export(filename, cache_key)
             return filepath
         
         except Exception as e:
             print(f"Error exporting to Excel: {e}")
             return None
     
+    @staticmethod
+    def export_columns(processes):
+        """Columns of the flattened export layout, in first-seen order (as pandas builds them)"""
+        columns = {}
+        for process in processes:
+            for column in ProcessRecord.from_dict(process).to_row():
+                columns.setdefault(column, None)
+        return list(columns)
+    
+    @staticmethod
+    def stream_csv(load_processes):
+        """
+        Generate a CSV export chunk by chunk
+        load_processes must return a fresh iterator each call: one pass
+        collects the columns, a second pass writes the rows
+        """
+        columns = ExcelHandler.export_columns(load_processes())
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, restval="", extrasaction="ignore")
+        writer.writeheader()
+        
+        for i, process in enumerate(load_processes(), 1):
+            writer.writerow(ProcessRecord.from_dict(process).to_row())
+            if i % CSV_CHUNK_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+    
+    @staticmethod
+    def export_to_parquet(load_processes, cache_key=None):
+        """
+        Export process data to a compressed Parquet file, one row group at a time
+        load_processes must return a fresh iterator each call (see stream_csv)
+        """
+        if pq is None:
+            raise RuntimeError("Parquet export requires the pyarrow package")
+        
+        try:
+            columns = ExcelHandler.export_columns(load_processes())
+            if not columns:
+                return None
+            
+            # Bag counts are numeric, insurance is a flag, everything else is text
+            def column_type(column):
+                if column.endswith((" Requested", " Delivered")):
+                    return pa.float64()
+                if column == "Vehicle Insurance":
+                    return pa.bool_()
+                return pa.string()
+            
+            def convert(column, value):
+                if value is None or value == "":
+                    return None
+                if column.endswith((" Requested", " Delivered")):
+                    return to_number(value)
+                if column == "Vehicle Insurance":
+                    return bool(value)
+                return str(value)
+            
+            schema = pa.schema([(column, column_type(column)) for column in columns])
+            
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            suffix = f"_{cache_key}" if cache_key else ""
+            filename = f"process_data_{timestamp}{suffix}.parquet"
+            filepath = os.path.join(EXPORT_PATH, filename)
+            
+            def write_chunk(writer, rows):
+                table = pa.Table.from_pydict(
+                    {c: [convert(c, row.get(c)) for row in rows] for c in columns},
+                    schema=schema
+                )
+                writer.write_table(table)
+            
+            with pq.ParquetWriter(filepath, schema, compression="snappy") as writer:
+                rows = []
+                for process in load_processes():
+                    rows.append(ProcessRecord.from_dict(process).to_row())
+                    if len(rows) == PARQUET_CHUNK_ROWS:
+                        write_chunk(writer, rows)
+                        rows = []
+                if rows:
+                    write_chunk(writer, rows)
+            
+            ExcelHandler._register_export(filename, cache_key)
+            return filepath
+        
+        except Exception as e:
+            print(f"Error exporting to Parquet: {e}")
+            return None
+    
     @staticmethod
     def _format_excel(filepath):
         """Format Excel file with colors and styles"""
@@ -153,16 +247,10 @@ class ExcelHandler:
     def get_latest_export():
         """Get the path to the latest export file"""
         try:
-            if not os.path.exists(EXPORT_PATH):
+            exports = ExcelHandler.list_exports()
+            if not exports:
                 return None
-            
-            files = os.listdir(EXPORT_PATH)
-            if not files:
-                return None
-            
-            # Get the most recently created file
-            latest = max(files, key=lambda f: os.path.getctime(os.path.join(EXPORT_PATH, f)))
-            return os.path.join(EXPORT_PATH, latest)
+            return os.path.join(EXPORT_PATH, exports[0])
         
         except Exception as e:
             print(f"Error getting latest export: {e}")
@@ -170,14 +258,148 @@ class ExcelHandler:
     
     @staticmethod
     def list_exports():
-        """List all exported files"""
+        """List all exported files, newest first"""
         try:
-            if not os.path.exists(EXPORT_PATH):
-                return []
-            
-            files = os.listdir(EXPORT_PATH)
-            return sorted(files, key=lambda f: os.path.getctime(os.path.join(EXPORT_PATH, f)), reverse=True)
+            return [entry["filename"] for entry in ExcelHandler._load_manifest()]
         
         except Exception as e:
             print(f"Error listing exports: {e}")
             return []
+    
+    # ==================== EXPORT MANIFEST ====================
+    
+    @staticmethod
+    def cache_key(revision, start_date=None, end_date=None, export_format="xlsx"):
+        """Key identifying an export's content: database revision, date range and format"""
+        source = f"{revision}:{start_date or ''}:{end_date or ''}:{export_format}"
+        return hashlib.sha1(source.encode()).hexdigest()[:12]
+    
+    @staticmethod
+    def _load_manifest():
+        """
+        Load the export manifest (newest first)
+        The exports folder is only scanned once, when no manifest exists yet
+        """
+        with _manifest_lock:
+            if os.path.exists(MANIFEST_PATH):
+                with open(MANIFEST_PATH, 'r') as f:
+                    return json.load(f)
+            
+            files = [f for f in os.listdir(EXPORT_PATH) if f.endswith((".xlsx", ".parquet"))]
+            files.sort(key=lambda f: os.path.getctime(os.path.join(EXPORT_PATH, f)), reverse=True)
+            manifest = [
+                {
+                    "filename": f,
+                    "key": None,
+                    "created_at": datetime.fromtimestamp(os.path.getctime(os.path.join(EXPORT_PATH, f))).isoformat()
+                }
+                for f in files
+            ]
+            ExcelHandler._save_manifest(manifest)
+            return manifest
+    
+    @staticmethod
+    def _save_manifest(manifest):
+        with _manifest_lock:
+            with open(MANIFEST_PATH, 'w') as f:
+                json.dump(manifest, f, indent=2)
+    
+    @staticmethod
+    def _register_export(filename, cache_key=None):
+        """Add a new export to the manifest and apply the retention limit"""
+        with _manifest_lock:
+            # The first manifest is built from a folder scan, which may already list this file
+            manifest = [e for e in ExcelHandler._load_manifest() if e["filename"] != filename]
+            manifest.insert(0, {
+                "filename": filename,
+                "key": cache_key,
+                "created_at": datetime.now().isoformat()
+            })
+            
+            for entry in manifest[EXPORT_RETENTION:]:
+                path = os.path.join(EXPORT_PATH, entry["filename"])
+                if os.path.exists(path):
+                    os.remove(path)
+            ExcelHandler._save_manifest(manifest[:EXPORT_RETENTION])
+    
+    @staticmethod
+    def get_cached_export(cache_key):
+        """Path of an existing export for a cache key, or None"""
+        try:
+            for entry in ExcelHandler._load_manifest():
+                if entry["key"] == cache_key:
+                    path = os.path.join(EXPORT_PATH, entry["filename"])
+                    if os.path.exists(path):
+                        return path
+            return None
+        
+        except Exception as e:
+            print(f"Error reading export manifest: {e}")
+            return None
+    
+    # ==================== BACKGROUND EXPORT JOBS ====================
+    
+    @staticmethod
+    def submit_export(revision, start_date, end_date, load_snapshot):
+        """
+        Start a background Excel export, or reuse a cached one
+        load_snapshot is called on the worker thread and returns the data
+        together with the revision it was read at, which keys the export
+        Returns the job status dictionary
+        """
+        cache_key = ExcelHandler.cache_key(revision, start_date, end_date)
+        cached = ExcelHandler.get_cached_export(cache_key)
+        
+        with _manifest_lock:
+            for job in _jobs.values():
+                if job["key"] == cache_key and job["status"] in ("queued", "running"):
+                    return dict(job)
+            
+            job = {
+                "id": uuid.uuid4().hex,
+                "key": cache_key,
+                "status": "queued",
+                "filename": None,
+                "error": None,
+                "cached": False,
+                "created_at": datetime.now().isoformat()
+            }
+            _jobs[job["id"]] = job
+            # Forget the oldest finished jobs (dicts keep insertion order);
+            # queued and running ones stay pollable until they finish
+            finished = [job_id for job_id, j in _jobs.items() if j["status"] in ("done", "failed")]
+            for job_id in finished[:max(0, len(_jobs) - JOB_HISTORY)]:
+                del _jobs[job_id]
+            
+            if cached:
+                job["status"] = "done"
+                job["filename"] = os.path.basename(cached)
+                job["cached"] = True
+                return dict(job)
+        
+        _executor.submit(ExcelHandler._run_export, job, start_date, end_date, load_snapshot)
+        return dict(job)
+    
+    @staticmethod
+    def _run_export(job, start_date, end_date, load_snapshot):
+        job["status"] = "running"
+        try:
+            revision, processes = load_snapshot()
+            if not processes:
+                raise ValueError("No data to export")
+            # Key the file by the revision the data was actually read at
+            job["key"] = ExcelHandler.cache_key(revision, start_date, end_date)
+            filepath = ExcelHandler.export_to_excel(processes, job["key"])
+            if not filepath:
+                raise RuntimeError("Failed to generate Excel file")
+            job["filename"] = os.path.basename(filepath)
+            job["status"] = "done"
+        except Exception as e:
+            job["error"] = str(e)
+            job["status"] = "failed"
+    
+    @staticmethod
+    def get_job(job_id):
+        """Status of a background export job, or None if unknown"""
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
@@ -5,6 +5,7 @@ import pytesseract
 import easyocr
 import re
 import os
+from plate_quality import assess_plate, correct_skew, BestCropSelector
 os.environ["YOLO_VERBOSE"] = "False"
 
 # ------------------------------
@@ -13,6 +14,7 @@ os.environ["YOLO_VERBOSE"] = "False"
 MODEL_PATH = "best.pt"     # Your trained SL model
 OUTPUT_PLATE = "./Output/plate.png"
 OUTPUT_CLEAN = "./Output/plate_clean.png"
+DESKEW_PLATES = True       # Rotate skewed plate crops level before OCR
 
 # ------------------------------
 # LOAD YOLO MODEL + OCR
@@ -86,6 +88,9 @@ def read_plate_text(clean):
 # ------------------------------
 cap = cv2.VideoCapture(0)
 
+# OCR each plate once, from the best crop seen over a few frames
+selector = BestCropSelector()
+
 print("Press 'q' to exit.")
 
 while True:
@@ -94,8 +99,11 @@ while True:
         break
 
     frame_small = cv2.resize(frame, (320, 256))
+    scale = (frame.shape[1] / 320, frame.shape[0] / 256)
     results = model.predict(frame_small, conf=0.4)
 
+    ready = []
+    boxes = []
     for r in results:
         for box in r.boxes:
             x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
@@ -104,20 +112,39 @@ while True:
             if plate.size == 0:
                 continue
 
-            cv2.imwrite(OUTPUT_PLATE, plate)
+            quality = assess_plate(plate, scale)
+            boxes.append(((x1, y1, x2, y2), (0, 255, 0) if quality["ok"] else (0, 0, 255)))
+
+            track = selector.offer((x1, y1, x2, y2), plate, quality)
+            if track:
+                ready.append(track)
+
+    # Draw once every crop has been taken, so no box ends up inside a crop
+    for (x1, y1, x2, y2), color in boxes:
+        cv2.rectangle(frame_small, (x1,y1), (x2,y2), color, 2)
+
+    ready.extend(selector.end_frame())
+
+    for track in ready:
+        plate = track["crop"]
+        if DESKEW_PLATES:
+            plate = correct_skew(plate, track["quality"]["skew"])
+
+        cv2.imwrite(OUTPUT_PLATE, plate)
 
-            clean = preprocess_for_ocr(plate)
-            raw_text = read_plate_text(clean)
-            formatted = format_plate(raw_text)
+        clean = preprocess_for_ocr(plate)
+        raw_text = read_plate_text(clean)
+        formatted = format_plate(raw_text)
 
-            print("\n--------------------------------")
-            print(" RAW:", raw_text)
-            print(" FORMATTED:", formatted)
-            print("--------------------------------\n")
+        print("\n--------------------------------")
+        print(" RAW:", raw_text)
+        print(" FORMATTED:", formatted)
+        print(" QUALITY:", track["quality"]["score"])
+        print("--------------------------------\n")
 
-            cv2.rectangle(frame_small, (x1,y1), (x2,y2), (0,255,0), 2)
-            cv2.putText(frame_small, formatted, (x1, y1-10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
+        x1, y1 = track["bbox"][:2]
+        cv2.putText(frame_small, formatted, (x1, y1-10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
 
     cv2.imshow("Sri Lanka Number Plate Detection", frame_small)
 
@@ -0,0 +1,263 @@
+import numpy as np
+
+# Marks a JSON key that was absent, so records convert back to the exact same shape
+MISSING = object()
+
+
+class _Record:
+    """
+    Base for compact, slot-based process records.
+
+    Subclasses list their JSON keys in _FIELDS as (json_key, attribute) pairs.
+    Keys that are not modelled are kept in 'extra', so converting a dict to a
+    record and back is lossless.
+    """
+    __slots__ = ("extra",)
+    _FIELDS = ()
+
+    def __init__(self, **values):
+        for key, attr in self._FIELDS:
+            setattr(self, attr, values.get(attr, MISSING))
+        self.extra = values.get("extra", {})
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from the JSON shape stored in the database"""
+        record = cls.__new__(cls)
+        data = data or {}
+        for key, attr in cls._FIELDS:
+            setattr(record, attr, data.get(key, MISSING))
+        known = {key for key, attr in cls._FIELDS}
+        record.extra = {k: v for k, v in data.items() if k not in known}
+        return record
+
+    def to_dict(self):
+        """Convert the record back to the JSON shape stored in the database"""
+        data = {}
+        for key, attr in self._FIELDS:
+            value = getattr(self, attr)
+            if value is not MISSING:
+                data[key] = value
+        data.update(self.extra)
+        return data
+
+    def value(self, attr, default=""):
+        """Get an attribute, or a default when its key was absent"""
+        value = getattr(self, attr)
+        return default if value is MISSING else value
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class DeliveryLine(_Record):
+    """One brand row of a delivery table"""
+    __slots__ = ("brand", "requested_bag", "delivery_bag")
+    _FIELDS = (
+        ("brand", "brand"),
+        ("requestedBag", "requested_bag"),
+        ("deliveryBag", "delivery_bag"),
+    )
+
+
+class WaitIn(_Record):
+    """Driver, helper and vehicle details recorded at wait in"""
+    __slots__ = (
+        "vehicle_number", "category", "arrival_date", "arrival_time",
+        "driver_name", "driver_phone", "driver_town", "driver_license", "driver_alcohol_test",
+        "helper_name", "helper_identity", "helper_phone", "helper_town", "helper_alcohol_test",
+        "vehicle_insurance", "driver_ppe_number", "helper_ppe_number", "delivery_table",
+    )
+    _FIELDS = (
+        ("vehicleNumber", "vehicle_number"),
+        ("category", "category"),
+        ("arrivalDate", "arrival_date"),
+        ("arrivalTime", "arrival_time"),
+        ("driverName", "driver_name"),
+        ("driverPhone", "driver_phone"),
+        ("driverTown", "driver_town"),
+        ("driverLicense", "driver_license"),
+        ("driverAlcoholTest", "driver_alcohol_test"),
+        ("helperName", "helper_name"),
+        ("helperIdentity", "helper_identity"),
+        ("helperPhone", "helper_phone"),
+        ("helperTown", "helper_town"),
+        ("helperAlcoholTest", "helper_alcohol_test"),
+        ("vehicleInsurance", "vehicle_insurance"),
+        ("driverPPENumber", "driver_ppe_number"),
+        ("helperPPENumber", "helper_ppe_number"),
+        ("deliveryTable", "delivery_table"),
+    )
+
+    @classmethod
+    def from_dict(cls, data):
+        record = super().from_dict(data)
+        if isinstance(record.delivery_table, list):
+            record.delivery_table = [
+                DeliveryLine.from_dict(line) if isinstance(line, dict) else line
+                for line in record.delivery_table
+            ]
+        return record
+
+    def to_dict(self):
+        data = super().to_dict()
+        if isinstance(self.delivery_table, list):
+            data["deliveryTable"] = [
+                line.to_dict() if isinstance(line, DeliveryLine) else line
+                for line in self.delivery_table
+            ]
+        return data
+
+
+class WaitOut(_Record):
+    """Departure details recorded at wait out"""
+    __slots__ = ("delivery_number", "wayout_time", "ppe_status", "total_issue", "notes")
+    _FIELDS = (
+        ("deliveryNumber", "delivery_number"),
+        ("wayoutTime", "wayout_time"),
+        ("ppeStatus", "ppe_status"),
+        ("totalIssue", "total_issue"),
+        ("notes", "notes"),
+    )
+
+
+class ProcessRecord(_Record):
+    """A weighbridge process (one vehicle visit) in the process queue"""
+    __slots__ = (
+        "id", "token_number", "vehicle_number", "date", "arrival_time", "status",
+        "wait_in", "wait_out", "created_at", "updated_at",
+    )
+    _FIELDS = (
+        ("id", "id"),
+        ("tokenNumber", "token_number"),
+        ("vehicleNumber", "vehicle_number"),
+        ("date", "date"),
+        ("arrivalTime", "arrival_time"),
+        ("status", "status"),
+        ("waitIn", "wait_in"),
+        ("waitOut", "wait_out"),
+        ("created_at", "created_at"),
+        ("updated_at", "updated_at"),
+    )
+
+    @classmethod
+    def from_dict(cls, data):
+        record = super().from_dict(data)
+        if isinstance(record.wait_in, dict):
+            record.wait_in = WaitIn.from_dict(record.wait_in)
+        if isinstance(record.wait_out, dict):
+            record.wait_out = WaitOut.from_dict(record.wait_out)
+        return record
+
+    def to_dict(self):
+        data = super().to_dict()
+        if isinstance(self.wait_in, WaitIn):
+            data["waitIn"] = self.wait_in.to_dict()
+        if isinstance(self.wait_out, WaitOut):
+            data["waitOut"] = self.wait_out.to_dict()
+        return data
+
+    @property
+    def delivery_lines(self):
+        """Delivery table rows recorded at wait in (empty when missing, malformed rows skipped)"""
+        if isinstance(self.wait_in, WaitIn) and isinstance(self.wait_in.delivery_table, list):
+            return [line for line in self.wait_in.delivery_table if isinstance(line, DeliveryLine)]
+        return []
+
+    def to_row(self):
+        """Flatten the record into the export column layout"""
+        wait_in = self.wait_in if isinstance(self.wait_in, WaitIn) else WaitIn.from_dict({})
+        row = {
+            "Token Number": self.value("token_number"),
+            "Vehicle Number": self.value("vehicle_number"),
+            "Date": self.value("date"),
+            "Arrival Time": self.value("arrival_time"),
+            "Status": self.value("status"),
+            "Driver Name": wait_in.value("driver_name"),
+            "Driver Phone": wait_in.value("driver_phone"),
+            "Driver Town": wait_in.value("driver_town"),
+            "Driver License": wait_in.value("driver_license"),
+            "Driver Alcohol Test": wait_in.value("driver_alcohol_test"),
+            "Helper Name": wait_in.value("helper_name"),
+            "Helper Identity": wait_in.value("helper_identity"),
+            "Helper Phone": wait_in.value("helper_phone"),
+            "Helper Town": wait_in.value("helper_town"),
+            "Helper Alcohol Test": wait_in.value("helper_alcohol_test"),
+            "Vehicle Insurance": wait_in.value("vehicle_insurance", False),
+            "Driver PPE Number": wait_in.value("driver_ppe_number"),
+            "Helper PPE Number": wait_in.value("helper_ppe_number"),
+        }
+
+        for line in self.delivery_lines:
+            brand = line.value("brand", "Brand")
+            row[f"{brand} Requested"] = line.value("requested_bag", 0)
+            row[f"{brand} Delivered"] = line.value("delivery_bag", 0)
+
+        if isinstance(self.wait_out, WaitOut) and self.wait_out.to_dict():
+            row["Departure Time"] = self.wait_out.value("wayout_time")
+            row["Total Issue"] = self.wait_out.value("total_issue")
+            row["Notes"] = self.wait_out.value("notes")
+
+        return row
+
+
+def to_number(value):
+    """Coerce a bag count to a number, treating blanks and bad input as 0"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ProcessTable:
+    """
+    Column-wise view of many process records for vectorized aggregation.
+
+    Bag counts are held as (processes x brands) NumPy matrices, so totals
+    and counts are single array operations instead of loops over dicts.
+    """
+
+    def __init__(self, records):
+        self.records = list(records)
+        brands = {}
+        for record in self.records:
+            for line in record.delivery_lines:
+                brands.setdefault(line.value("brand", "Brand"), len(brands))
+        self.brands = list(brands)
+
+        self.requested = np.zeros((len(self.records), len(self.brands)))
+        self.delivered = np.zeros((len(self.records), len(self.brands)))
+        for row, record in enumerate(self.records):
+            for line in record.delivery_lines:
+                col = brands[line.value("brand", "Brand")]
+                self.requested[row, col] += to_number(line.value("requested_bag", 0))
+                self.delivered[row, col] += to_number(line.value("delivery_bag", 0))
+
+        self.status = np.array([r.value("status") for r in self.records], dtype=object)
+
+    @classmethod
+    def from_dicts(cls, processes):
+        """Build a table from processes in the JSON shape"""
+        return cls(ProcessRecord.from_dict(p) for p in processes)
+
+    def __len__(self):
+        return len(self.records)
+
+    def bag_totals(self):
+        """Requested and delivered bag totals per brand"""
+        requested = self.requested.sum(axis=0)
+        delivered = self.delivered.sum(axis=0)
+        return {
+            brand: {"requested": float(requested[i]), "delivered": float(delivered[i])}
+            for i, brand in enumerate(self.brands)
+        }
+
+    def status_counts(self):
+        """Number of processes per status"""
+        if not len(self.status):
+            return {}
+        statuses, counts = np.unique(self.status.astype(str), return_counts=True)
+        return {str(s): int(c) for s, c in zip(statuses, counts)}
@@ -0,0 +1,135 @@
+import cv2
+
+# ------------------------------
+# QUALITY THRESHOLDS
+# (sizes are in pixels of the 320x256 detection frame, the aspect ratio is
+# measured in the original frame; checked against the labelled valid/test sets)
+# ------------------------------
+MIN_PLATE_WIDTH = 20
+MIN_PLATE_HEIGHT = 8        # portrait frames are squashed vertically by the resize
+MIN_ASPECT = 0.7            # two-line (motorcycle) plates are close to square
+MAX_ASPECT = 12.0
+MIN_SHARPNESS = 50.0        # variance of the Laplacian
+MAX_SKEW = 30.0             # degrees; beyond this OCR is hopeless
+DESKEW_THRESHOLD = 3.0      # degrees; below this the crop is left as is
+GOOD_PLATE_WIDTH = 80       # crops this wide get the full size score
+GOOD_PLATE_SCORE = 12000.0  # about the 75th percentile of the labelled plates;
+                            # sharper crops are read without waiting for more frames
+
+
+def estimate_skew(gray):
+    """Estimate a plate crop's skew in degrees, as the rotation that levels its text"""
+    edges = cv2.Canny(gray, 50, 150)
+    points = cv2.findNonZero(edges)
+    if points is None or len(points) < 10:
+        return 0.0
+    angle = cv2.minAreaRect(points)[2]
+    # minAreaRect conventions differ between OpenCV versions; plates are wider
+    # than tall, so fold the angle into [-45, 45)
+    return float((angle + 45) % 90 - 45)
+
+
+def assess_plate(crop, scale=(1.0, 1.0)):
+    """
+    Score a plate crop before OCR
+    'scale' is the (x, y) factor from the detection frame back to the original
+    frame, so the aspect ratio is not distorted by the non-uniform resize
+    Returns a dict with the metrics, an overall 'score' for ranking crops of
+    the same plate, and 'ok' / 'reason' for the pass/fail decision
+    """
+    height, width = crop.shape[:2]
+    quality = {
+        "width": int(width),
+        "height": int(height),
+        "aspect": round(width * scale[0] / (height * scale[1]), 2) if height else 0.0,
+        "sharpness": 0.0,
+        "skew": 0.0,
+        "score": 0.0,
+        "ok": False,
+        "reason": None,
+    }
+
+    if width < MIN_PLATE_WIDTH or height < MIN_PLATE_HEIGHT:
+        quality["reason"] = "too small"
+        return quality
+    if not MIN_ASPECT <= quality["aspect"] <= MAX_ASPECT:
+        quality["reason"] = "bad aspect ratio"
+        return quality
+
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    quality["sharpness"] = round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 1)
+    quality["skew"] = round(estimate_skew(gray), 1)
+    quality["score"] = round(quality["sharpness"] * min(1.0, width / GOOD_PLATE_WIDTH), 1)
+
+    if quality["sharpness"] < MIN_SHARPNESS:
+        quality["reason"] = "blurred"
+    elif abs(quality["skew"]) > MAX_SKEW:
+        quality["reason"] = "too skewed"
+    else:
+        quality["ok"] = True
+    return quality
+
+
+def correct_skew(crop, angle):
+    """Rotate a plate crop so its text is horizontal (no-op for small angles)"""
+    if abs(angle) < DESKEW_THRESHOLD:
+        return crop
+    height, width = crop.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(crop, matrix, (width, height),
+                          flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+class BestCropSelector:
+    """
+    Defer OCR in video mode until the best crop of a plate has been seen
+
+    Crops are grouped across frames by box overlap. A plate is released for
+    OCR as soon as a crop scores 'good_score', or otherwise with its best
+    passing crop once it has been deferred for 'max_frames' frames or has
+    left the view. A released plate is kept as done until it leaves the view,
+    so it is read only once per pass.
+    """
+
+    def __init__(self, good_score=GOOD_PLATE_SCORE, max_frames=5, min_iou=0.3):
+        self.good_score = good_score
+        self.max_frames = max_frames
+        self.min_iou = min_iou
+        self.tracks = []
+
+    def offer(self, bbox, crop, quality):
+        """Add a crop from the current frame; returns a track to OCR now, or None"""
+        track = next((t for t in self.tracks if box_iou(t["bbox"], bbox) >= self.min_iou), None)
+        if track is None:
+            track = {"bbox": bbox, "crop": None, "quality": None, "frames": 0, "seen": True, "done": False}
+            self.tracks.append(track)
+        track["bbox"] = bbox
+        track["seen"] = True
+        track["frames"] += 1
+        if track["done"]:
+            return None
+        if quality["ok"] and (track["quality"] is None or quality["score"] > track["quality"]["score"]):
+            track["crop"] = crop.copy()
+            track["quality"] = quality
+
+        if track["quality"] and (track["quality"]["score"] >= self.good_score or track["frames"] >= self.max_frames):
+            track["done"] = True
+            return track
+        return None
+
+    def end_frame(self):
+        """Finish a frame; returns the tracks that left the view with a usable crop"""
+        released = [t for t in self.tracks if not t["seen"] and t["quality"] and not t["done"]]
+        self.tracks = [t for t in self.tracks if t["seen"]]
+        for track in self.tracks:
+            track["seen"] = False
+        return released
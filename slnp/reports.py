@@ -0,0 +1,220 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from models import ProcessRecord, ProcessTable, WaitOut, to_number
+
+# Daily rollups file path
+ROLLUP_PATH = "./Database/rollups.json"
+
+# Ensure directory exists
+os.makedirs(os.path.dirname(ROLLUP_PATH), exist_ok=True)
+
+
+def _minutes(value):
+    """Minutes since midnight for an 'HH:MM' time, or None if it can't be parsed"""
+    try:
+        hours, minutes = str(value).split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except (TypeError, ValueError):
+        return None
+
+
+def _empty_rollup():
+    return {
+        "vehicles": 0,
+        "status": {},
+        "brands": {},
+        "hourly": {},
+        "dwell_minutes": 0.0,
+        "dwell_count": 0,
+    }
+
+
+class Reports:
+    """Daily report rollups, updated incrementally on every process write"""
+
+    @staticmethod
+    def load():
+        """Load all rollups, keyed by day (YYYY-MM-DD)"""
+        try:
+            if os.path.exists(ROLLUP_PATH):
+                with open(ROLLUP_PATH, 'r') as f:
+                    return json.load(f)
+            return {}
+        except Exception as e:
+            print(f"Error loading rollups: {e}")
+            return {}
+
+    @staticmethod
+    def save(rollups):
+        """Save all rollups"""
+        try:
+            with open(ROLLUP_PATH, 'w') as f:
+                json.dump(rollups, f, indent=2)
+            return True
+        except Exception as e:
+            print(f"Error saving rollups: {e}")
+            return False
+
+    @staticmethod
+    def exists():
+        """Whether rollups have been built yet"""
+        return os.path.exists(ROLLUP_PATH)
+
+    @staticmethod
+    def contribution(process):
+        """What a single process adds to its day's rollup"""
+        record = ProcessRecord.from_dict(process)
+        rollup = _empty_rollup()
+        rollup["vehicles"] = 1
+        rollup["status"][str(record.value("status"))] = 1
+
+        for line in record.delivery_lines:
+            totals = rollup["brands"].setdefault(line.value("brand", "Brand"), {"requested": 0, "delivered": 0})
+            totals["requested"] += to_number(line.value("requested_bag", 0))
+            totals["delivered"] += to_number(line.value("delivery_bag", 0))
+        # Brands without any bags are left out, as in a full recompute
+        rollup["brands"] = {b: t for b, t in rollup["brands"].items() if t["requested"] or t["delivered"]}
+
+        arrival = _minutes(record.value("arrival_time"))
+        if arrival is not None:
+            rollup["hourly"][f"{arrival // 60:02d}"] = 1
+
+        if isinstance(record.wait_out, WaitOut):
+            departure = _minutes(record.wait_out.value("wayout_time"))
+            if arrival is not None and departure is not None:
+                # A departure earlier than the arrival crossed midnight
+                rollup["dwell_minutes"] = float((departure - arrival) % (24 * 60))
+                rollup["dwell_count"] = 1
+        return rollup
+
+    @staticmethod
+    def _merge(target, rollup, sign):
+        """Add (sign=1) or remove (sign=-1) a rollup into another one"""
+        for key in ("vehicles", "dwell_minutes", "dwell_count"):
+            target[key] += sign * rollup[key]
+        for key in ("status", "hourly"):
+            for name, count in rollup[key].items():
+                target[key][name] = target[key].get(name, 0) + sign * count
+                if not target[key][name]:
+                    del target[key][name]
+        for brand, totals in rollup["brands"].items():
+            current = target["brands"].setdefault(brand, {"requested": 0, "delivered": 0})
+            current["requested"] += sign * totals["requested"]
+            current["delivered"] += sign * totals["delivered"]
+            if not current["requested"] and not current["delivered"]:
+                del target["brands"][brand]
+
+    @staticmethod
+    def apply(day, before=None, after=None):
+        """
+        Update a day's rollup for one process write.
+
+        'before' and 'after' are contributions of the process before and
+        after the write (None for inserts and deletes respectively).
+        """
+        rollups = Reports.load()
+        rollup = rollups.setdefault(day, _empty_rollup())
+        if before:
+            Reports._merge(rollup, before, -1)
+        if after:
+            Reports._merge(rollup, after, 1)
+        if not rollup["vehicles"]:
+            del rollups[day]
+        Reports.save(rollups)
+
+    @staticmethod
+    def recompute(processes, day_of):
+        """
+        Recompute daily rollups from scratch with vectorized pandas/NumPy.
+
+        'day_of' maps a process to its day key, so rollups line up with the
+        database partitions.
+        """
+        if not processes:
+            return {}
+        table = ProcessTable.from_dicts(processes)
+        days = pd.Series([day_of(p) for p in processes])
+
+        arrival = pd.Series([r.value("arrival_time") for r in table.records]).map(_minutes).astype(float)
+        departure = pd.Series([
+            r.wait_out.value("wayout_time") if isinstance(r.wait_out, WaitOut) else None
+            for r in table.records
+        ]).map(_minutes).astype(float)
+        dwell = (departure - arrival) % (24 * 60)
+
+        frame = pd.DataFrame({
+            "day": days,
+            "status": table.status.astype(str),
+            "hour": (arrival // 60).map(lambda h: None if np.isnan(h) else f"{int(h):02d}"),
+            "dwell": dwell,
+        })
+        requested = pd.DataFrame(table.requested, columns=table.brands).groupby(days).sum()
+        delivered = pd.DataFrame(table.delivered, columns=table.brands).groupby(days).sum()
+        vehicles = frame.groupby("day").size()
+        dwell_sum = frame.groupby("day")["dwell"].sum()
+        dwell_count = frame.groupby("day")["dwell"].count()
+        status = frame.groupby(["day", "status"]).size()
+        hourly = frame.dropna(subset=["hour"]).groupby(["day", "hour"]).size()
+
+        rollups = {}
+        for day in vehicles.index:
+            rollup = _empty_rollup()
+            rollup["vehicles"] = int(vehicles[day])
+            rollup["dwell_minutes"] = float(dwell_sum.get(day, 0))
+            rollup["dwell_count"] = int(dwell_count.get(day, 0))
+            rollup["status"] = {s: int(c) for s, c in status[day].items()}
+            if day in hourly.index.get_level_values(0):
+                rollup["hourly"] = {h: int(c) for h, c in hourly[day].items()}
+            rollup["brands"] = {
+                brand: {"requested": float(requested.at[day, brand]), "delivered": float(delivered.at[day, brand])}
+                for brand in table.brands
+                if requested.at[day, brand] or delivered.at[day, brand]
+            }
+            rollups[day] = rollup
+        return rollups
+
+    @staticmethod
+    def rebuild(processes, day_of):
+        """Replace the stored rollups with a full recompute"""
+        rollups = Reports.recompute(processes, day_of)
+        Reports.save(rollups)
+        return rollups
+
+    @staticmethod
+    def clear():
+        """Remove all rollups"""
+        Reports.save({})
+
+    @staticmethod
+    def daily(start_date=None, end_date=None):
+        """Per-day report for a date range (ISO dates, both inclusive)"""
+        report = {}
+        for day, rollup in sorted(Reports.load().items()):
+            if (start_date is None or day >= start_date) and (end_date is None or day <= end_date):
+                report[day] = Reports._summarize(rollup)
+        return report
+
+    @staticmethod
+    def summary(start_date=None, end_date=None):
+        """Combined report over a date range"""
+        total = _empty_rollup()
+        for day, rollup in Reports.load().items():
+            if (start_date is None or day >= start_date) and (end_date is None or day <= end_date):
+                Reports._merge(total, rollup, 1)
+        return Reports._summarize(total)
+
+    @staticmethod
+    def _summarize(rollup):
+        """Turn a rollup into report fields (adds the average dwell time)"""
+        count = rollup["dwell_count"]
+        return {
+            "vehicles": rollup["vehicles"],
+            "status": rollup["status"],
+            "brands": rollup["brands"],
+            "hourly": dict(sorted(rollup["hourly"].items())),
+            "average_dwell_minutes": round(rollup["dwell_minutes"] / count, 1) if count else None,
+        }